@@ -10,7 +10,9 @@ Usage:
     python install.py --uninstall # remove slimductor files
     python install.py --dry-run   # preview changes without writing
 """
+import hashlib
 import json
+import os
 import shutil
 import sys
 from pathlib import Path
@@ -26,9 +28,14 @@ FILES_TO_COPY = [
     ("reference/orchestrator-protocol.md",   CLAUDE_DIR / "reference" / "orchestrator-protocol.md"),
 ]
 
+# Hooks call the interpreter running this installer by absolute path — going
+# through the `py` launcher costs a registry/config scan on every session event.
+PYTHON = Path(sys.executable).as_posix()
+REGISTRY = (CLAUDE_DIR / "registry.py").as_posix()
+
 HOOKS_TO_ADD = {
-    "SessionStart": [{"hooks": [{"type": "command", "command": f"py {CLAUDE_DIR}/registry.py register"}]}],
-    "SessionEnd":   [{"hooks": [{"type": "command", "command": f"py {CLAUDE_DIR}/registry.py deregister"}]}],
+    "SessionStart": [{"hooks": [{"type": "command", "command": f'"{PYTHON}" "{REGISTRY}" register'}]}],
+    "SessionEnd":   [{"hooks": [{"type": "command", "command": f'"{PYTHON}" "{REGISTRY}" deregister'}]}],
 }
 
 ENV_TO_ADD = {
@@ -36,71 +43,172 @@ ENV_TO_ADD = {
 }
 
 
+# Chunk size for streaming file hashes.
+COPY_BUFSIZE = 1 << 20
+
+
 def log(msg: str, dry_run: bool = False):
     prefix = "[dry-run] " if dry_run else ""
     print(f"{prefix}{msg}")
 
 
+def _fastcopy(src: Path, dst: Path):
+    """shutil.copy2, trying a kernel-side CopyFile2 first on Windows.
+
+    On Linux and macOS shutil.copy2 already copies in the kernel (sendfile / fcopyfile).
+    """
+    if sys.platform == "win32":
+        import ctypes
+        # CopyFile2 returns an HRESULT; S_OK (0) means done, including metadata.
+        if ctypes.windll.kernel32.CopyFile2(ctypes.c_wchar_p(str(src)), ctypes.c_wchar_p(str(dst)), None) == 0:
+            return
+    shutil.copy2(src, dst)
+
+
+def _same_file(a: Path, b: Path) -> bool:
+    """True if a and b have identical contents (size check, then BLAKE2b)."""
+    if a.stat().st_size != b.stat().st_size:
+        return False
+    mv = memoryview(bytearray(COPY_BUFSIZE))
+
+    def digest(path: Path) -> bytes:
+        h = hashlib.blake2b(digest_size=16)
+        with open(path, "rb") as f:
+            while True:
+                n = f.readinto(mv)
+                if not n:
+                    break
+                h.update(mv[:n])
+        return h.digest()
+
+    return digest(a) == digest(b)
+
+
 def copy_files(dry_run: bool = False):
+    if not dry_run:
+        # Several files share a directory — create each one once up front.
+        for parent in {dst.parent for _, dst in FILES_TO_COPY}:
+            parent.mkdir(parents=True, exist_ok=True)
     for src_rel, dst in FILES_TO_COPY:
         src = REPO_DIR / src_rel
         if not src.exists():
             print(f"  WARNING: source not found: {src}")
             continue
+        if dst.exists() and _same_file(src, dst):
+            log(f"  unchanged: {src_rel}", dry_run)
+            continue
         if not dry_run:
-            dst.parent.mkdir(parents=True, exist_ok=True)
             # Back up existing file if present
+            moved = False
             if dst.exists():
                 backup = dst.with_suffix(dst.suffix + ".bak")
-                shutil.copy2(dst, backup)
+                # dst is about to be rewritten, so move it aside rather than
+                # copying it. Symlinks are copied so we keep writing through them.
+                if dst.is_symlink():
+                    _fastcopy(dst, backup)
+                else:
+                    try:
+                        os.replace(dst, backup)
+                        moved = True
+                    except OSError:
+                        _fastcopy(dst, backup)
                 log(f"  backed up: {dst.name} → {dst.name}.bak")
-            shutil.copy2(src, dst)
+            try:
+                _fastcopy(src, dst)
+            except BaseException:
+                if moved:
+                    os.replace(backup, dst)  # put the original back
+                raise
         log(f"  copied: {src_rel} → {dst}", dry_run)
 
 
-def patch_settings(dry_run: bool = False):
+def _is_registry_hook(h: dict) -> bool:
+    """True for any hook entry that runs our registry.py — current or older installs."""
+    command = h.get("hooks", [{}])[0].get("command", "")
+    return REGISTRY in command or f"{CLAUDE_DIR}/registry.py" in command
+
+
+def _mutate_settings(mutator, dry_run: bool = False, action: str = "patch"):
+    """Read settings.json once, apply mutator(settings) -> changed, write only if changed.
+
+    Returns the mutator's result, or None if settings.json could not be parsed.
+    """
     settings_path = CLAUDE_DIR / "settings.json"
 
     if settings_path.exists():
         try:
-            settings = json.loads(settings_path.read_text())
+            settings = json.loads(settings_path.read_text(encoding="utf-8"))
         except json.JSONDecodeError:
-            print(f"  ERROR: {settings_path} is not valid JSON. Skipping settings patch.")
-            return
+            print(f"  ERROR: {settings_path} is not valid JSON. Skipping settings {action}.")
+            return None
     else:
         settings = {}
 
-    changed = False
-
-    # Add env vars
-    settings.setdefault("env", {})
-    for key, value in ENV_TO_ADD.items():
-        if settings["env"].get(key) != value:
-            settings["env"][key] = value
-            log(f"  settings.json: env.{key} = {value}", dry_run)
-            changed = True
-
-    # Add hooks (merge, don't overwrite)
-    settings.setdefault("hooks", {})
-    for event, hook_list in HOOKS_TO_ADD.items():
-        existing = settings["hooks"].get(event, [])
-        # Check if our command is already there
-        our_command = hook_list[0]["hooks"][0]["command"]
-        already_present = any(
-            h.get("hooks", [{}])[0].get("command", "") == our_command
-            for h in existing
-        )
-        if not already_present:
-            settings["hooks"].setdefault(event, []).extend(hook_list)
-            log(f"  settings.json: added {event} hook", dry_run)
-            changed = True
+    changed = mutator(settings)
 
     if changed and not dry_run:
-        backup = settings_path.with_suffix(".json.bak")
-        if settings_path.exists():
-            shutil.copy2(settings_path, backup)
-            log(f"  backed up: settings.json → settings.json.bak")
-        settings_path.write_text(json.dumps(settings, indent=2))
+        _write_settings(settings_path, settings)
+    return changed
+
+
+def _write_settings(settings_path: Path, settings: dict):
+    """Atomically replace settings.json — readers see the old file or the new one, never a partial write."""
+    data = json.dumps(settings, indent=2, ensure_ascii=False).encode("utf-8")
+    # Replace the real file, not a symlink pointing at it (e.g. a dotfiles repo)
+    target = settings_path.resolve()
+    tmp = target.with_name(target.name + ".tmp")
+    try:
+        tmp.write_bytes(data)
+        if target.exists():
+            shutil.copymode(target, tmp)
+        os.replace(tmp, target)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+
+
+def patch_settings(dry_run: bool = False):
+    def add_ours(settings: dict) -> bool:
+        changed = False
+
+        # Add env vars
+        settings.setdefault("env", {})
+        for key, value in ENV_TO_ADD.items():
+            if settings["env"].get(key) != value:
+                settings["env"][key] = value
+                log(f"  settings.json: env.{key} = {value}", dry_run)
+                changed = True
+
+        # Add hooks (merge, don't overwrite)
+        settings.setdefault("hooks", {})
+        for event, hook_list in HOOKS_TO_ADD.items():
+            existing = settings["hooks"].get(event, [])
+            # Check if our command is already there
+            our_command = hook_list[0]["hooks"][0]["command"]
+            already_present = any(
+                h.get("hooks", [{}])[0].get("command", "") == our_command
+                for h in existing
+            )
+            # Drop registry hooks from earlier installs (py launcher / other interpreter)
+            outdated = [
+                h for h in existing
+                if _is_registry_hook(h) and h.get("hooks", [{}])[0].get("command", "") != our_command
+            ]
+            if outdated:
+                settings["hooks"][event] = [h for h in existing if h not in outdated]
+                log(f"  settings.json: replaced outdated {event} hook", dry_run)
+                changed = True
+            if not already_present:
+                settings["hooks"].setdefault(event, []).extend(hook_list)
+                log(f"  settings.json: added {event} hook", dry_run)
+                changed = True
+
+        return changed
+
+    changed = _mutate_settings(add_ours, dry_run)
+    if changed is None:
+        return
+    if changed and not dry_run:
         log("  settings.json updated")
     elif not changed:
         log("  settings.json: already up to date")
@@ -124,21 +232,14 @@ def uninstall(dry_run: bool = False):
             log(f"  removed: {dst}", dry_run)
 
     # Remove hooks from settings.json
-    settings_path = CLAUDE_DIR / "settings.json"
-    if settings_path.exists():
-        try:
-            settings = json.loads(settings_path.read_text())
-        except json.JSONDecodeError:
-            return
-
+    def remove_ours(settings: dict) -> bool:
         changed = False
-        for event, hook_list in HOOKS_TO_ADD.items():
-            our_command = hook_list[0]["hooks"][0]["command"]
+        for event in HOOKS_TO_ADD:
             if event in settings.get("hooks", {}):
                 before = len(settings["hooks"][event])
                 settings["hooks"][event] = [
                     h for h in settings["hooks"][event]
-                    if h.get("hooks", [{}])[0].get("command", "") != our_command
+                    if not _is_registry_hook(h)
                 ]
                 if len(settings["hooks"][event]) < before:
                     changed = True
@@ -149,9 +250,9 @@ def uninstall(dry_run: bool = False):
                 del settings["env"][key]
                 changed = True
                 log(f"  settings.json: removed env.{key}", dry_run)
+        return changed
 
-        if changed and not dry_run:
-            settings_path.write_text(json.dumps(settings, indent=2))
+    _mutate_settings(remove_ours, dry_run, action="cleanup")
 
     print("Done. Restart Claude Code to apply changes.")
 
@@ -1,7 +1,8 @@
 #!/usr/bin/env python3
 """Claude Code session registry — multi-instance coordination.
 
-Writes a JSON file to ~/.claude/active/ on register, deletes it on deregister.
+Writes a key=value session file to ~/.claude/active/ on register, deletes it
+on deregister.
 Uses PID liveness to detect stale entries automatically.
 
 Usage:
@@ -13,11 +14,49 @@ Usage:
 Called automatically by SessionStart and Stop hooks in settings.json.
 Can also be run manually: py ~/.claude/registry.py check
 """
-import json, os, sys, time
+import calendar, functools, json, os, sys, time
 from pathlib import Path
 
 ACTIVE_DIR = Path.home() / ".claude" / "active"
 STALE_HOURS = 4
+SESSION_EXT = ".session"
+LEGACY_EXT = ".json"      # entries written by older versions — still read and cleaned
+# Linux with procfs mounted: liveness is a stat of /proc/<pid>, no signal syscall.
+_HAVE_PROCFS = sys.platform.startswith("linux") and os.path.isdir("/proc/self")
+
+if sys.platform == "win32":
+    # Windows-only FFI setup, done once at import and skipped entirely elsewhere.
+    import ctypes
+    import ctypes.wintypes as wt
+
+    _k32 = ctypes.windll.kernel32
+    _ntdll = ctypes.windll.ntdll
+
+    PROCESS_QUERY_INFORMATION = 0x0400
+    PROCESS_QUERY_LIMITED_INFORMATION = 0x1000
+    ProcessBasicInformation = 0
+
+    class PROCESS_BASIC_INFORMATION(ctypes.Structure):
+        _fields_ = [
+            ("ExitStatus",                   ctypes.c_long),
+            ("PebBaseAddress",               ctypes.c_void_p),
+            ("AffinityMask",                 ctypes.c_size_t),   # ULONG_PTR — pointer-sized
+            ("BasePriority",                 ctypes.c_long),
+            ("UniqueProcessId",              ctypes.c_size_t),
+            ("InheritedFromUniqueProcessId", ctypes.c_size_t),
+        ]
+
+    # Explicit signatures: HANDLEs stay pointer-sized on 64-bit (the default
+    # int restype truncates them) and ctypes skips per-call argument inference.
+    _k32.OpenProcess.argtypes = [wt.DWORD, wt.BOOL, wt.DWORD]
+    _k32.OpenProcess.restype = wt.HANDLE
+    _k32.CloseHandle.argtypes = [wt.HANDLE]
+    _k32.CloseHandle.restype = wt.BOOL
+    _k32.QueryFullProcessImageNameW.argtypes = [wt.HANDLE, wt.DWORD, wt.LPWSTR, ctypes.POINTER(wt.DWORD)]
+    _k32.QueryFullProcessImageNameW.restype = wt.BOOL
+    _ntdll.NtQueryInformationProcess.argtypes = [
+        wt.HANDLE, ctypes.c_int, ctypes.POINTER(PROCESS_BASIC_INFORMATION), wt.ULONG, ctypes.POINTER(wt.ULONG)]
+    _ntdll.NtQueryInformationProcess.restype = ctypes.c_long   # NTSTATUS
 
 
 def is_alive(pid: int) -> bool:
@@ -26,13 +65,13 @@ def is_alive(pid: int) -> bool:
         return False
     try:
         if sys.platform == "win32":
-            import ctypes
-            PROCESS_QUERY_INFORMATION = 0x0400
-            h = ctypes.windll.kernel32.OpenProcess(PROCESS_QUERY_INFORMATION, False, pid)
+            h = _k32.OpenProcess(PROCESS_QUERY_INFORMATION, False, pid)
             if h:
-                ctypes.windll.kernel32.CloseHandle(h)
+                _k32.CloseHandle(h)
                 return True
             return False
+        elif _HAVE_PROCFS:
+            return os.path.exists(f"/proc/{int(pid)}")
         else:
             os.kill(pid, 0)
             return True
@@ -40,131 +79,212 @@ def is_alive(pid: int) -> bool:
         return False
 
 
-def _win_process_snapshot() -> tuple:
-    """Return (pid_to_parent, pid_to_name) maps for all Windows processes."""
-    import ctypes
-    import ctypes.wintypes
+@functools.lru_cache(maxsize=128)
+def _is_alive_cached(pid: int) -> bool:
+    """is_alive() memoized for one active_sessions() pass — sessions often share a tracking PID."""
+    return is_alive(pid)
 
-    class PROCESSENTRY32(ctypes.Structure):
-        _fields_ = [
-            ("dwSize",             ctypes.wintypes.DWORD),
-            ("cntUsage",           ctypes.wintypes.DWORD),
-            ("th32ProcessID",      ctypes.wintypes.DWORD),
-            ("th32DefaultHeapID",  ctypes.c_size_t),   # ULONG_PTR — pointer-sized
-            ("th32ModuleID",       ctypes.wintypes.DWORD),
-            ("cntThreads",         ctypes.wintypes.DWORD),
-            ("th32ParentProcessID",ctypes.wintypes.DWORD),
-            ("pcPriClassBase",     ctypes.c_long),
-            ("dwFlags",            ctypes.wintypes.DWORD),
-            ("szExeFile",          ctypes.c_char * 260),
-        ]
 
-    TH32CS_SNAPPROCESS = 0x00000002
-    snap = ctypes.windll.kernel32.CreateToolhelp32Snapshot(TH32CS_SNAPPROCESS, 0)
-    if snap == ctypes.wintypes.HANDLE(-1).value:
-        return {}, {}
-    pid_map, name_map = {}, {}
-    entry = PROCESSENTRY32()
-    entry.dwSize = ctypes.sizeof(PROCESSENTRY32)
+def _win_process_info(pid: int):
+    """Return (parent_pid, exe_name bytes) for one Windows process, or None if it can't be opened."""
+    h = _k32.OpenProcess(PROCESS_QUERY_LIMITED_INFORMATION, False, pid)
+    if not h:
+        return None
     try:
-        if ctypes.windll.kernel32.Process32First(snap, ctypes.byref(entry)):
-            while True:
-                pid_map[entry.th32ProcessID] = entry.th32ParentProcessID
-                name_map[entry.th32ProcessID] = entry.szExeFile.decode("utf-8", errors="replace").lower()
-                if not ctypes.windll.kernel32.Process32Next(snap, ctypes.byref(entry)):
-                    break
+        pbi = PROCESS_BASIC_INFORMATION()
+        status = _ntdll.NtQueryInformationProcess(
+            h, ProcessBasicInformation, ctypes.byref(pbi), ctypes.sizeof(pbi), None)
+        if status != 0:
+            return None
+        # Sized for the longest extended-length path, so long install dirs never fail.
+        buf = ctypes.create_unicode_buffer(32768)
+        size = wt.DWORD(32768)
+        name = b""
+        if _k32.QueryFullProcessImageNameW(h, 0, buf, ctypes.byref(size)):
+            # Only the basename is encoded, to compare against the bytes name sets.
+            name = os.path.basename(buf.value).lower().encode("utf-8", errors="replace")
+        return pbi.InheritedFromUniqueProcessId, name
     finally:
-        ctypes.windll.kernel32.CloseHandle(snap)
-    return pid_map, name_map
+        _k32.CloseHandle(h)
+
+
+def _linux_process_info(pid: int):
+    """Return (parent_pid, comm_name bytes) for one Linux process via /proc/<pid>/status, or None if gone."""
+    try:
+        with open(f"/proc/{pid}/status", "rb") as f:
+            data = f.read()
+    except OSError:
+        return None
+    name = data.partition(b"Name:\t")[2].split(b"\n", 1)[0]
+    ppid = int(data.partition(b"\nPPid:\t")[2].split(b"\n", 1)[0])
+    return ppid, name.lower()
 
 
 # Process names that are Claude Code itself (the stable session process).
-_CLAUDE_EXES = {"claude.exe", "claude"}
+# Compared as bytes so ancestor names never need decoding.
+_CLAUDE_EXES = frozenset((b"claude.exe", b"claude"))
 # Process names that are short-lived wrappers we want to skip past.
-_SKIP_EXES = {"py.exe", "python.exe", "python3", "python", "bash.exe", "bash", "sh.exe", "sh"}
+_SKIP_EXES = frozenset((b"py.exe", b"python.exe", b"python3", b"python", b"bash.exe", b"bash", b"sh.exe", b"sh"))
 
 
 def get_tracking_pid() -> int:
     """Return the long-lived parent PID to use for liveness checking.
 
-    On Unix: os.getppid() is the shell / Claude Code process — correct.
-    On Windows: `py script.py` spawns through py.exe and potentially several
-    bash.exe subshells before reaching claude.exe.  Walk up the process tree
-    until we find claude.exe (preferred) or the first non-skippable ancestor.
+    Hooks run registry.py under a Python interpreter, often through one or
+    more shell wrappers (bash.exe subshells on Windows, sh -c on Linux, or the
+    py.exe launcher for manual and older installs) before reaching Claude
+    Code.  Walk up the process tree past those interpreter and shell processes
+    until we find claude (preferred) or the first non-skippable ancestor.
+    On other Unixes: os.getppid() is the shell / Claude Code process.
     """
-    if sys.platform != "win32":
-        ppid = os.getppid()
-        return ppid if ppid > 1 else os.getpid()
-    try:
-        pid_map, name_map = _win_process_snapshot()
-        pid = os.getpid()
-        last_alive = pid
-        for _ in range(15):                     # safety cap
-            parent = pid_map.get(pid, 0)
-            if parent <= 1 or parent == pid:
-                break
-            pname = name_map.get(parent, "")
-            if pname in _CLAUDE_EXES:
-                return parent                   # found claude.exe — ideal
-            if is_alive(parent):
-                last_alive = parent
+    if sys.platform == "win32":
+        proc_info = _win_process_info
+    elif _HAVE_PROCFS:
+        proc_info = _linux_process_info
+    else:
+        proc_info = None
+    if proc_info is not None:
+        try:
+            # Query only our own ancestors (≤15 lookups) rather than
+            # enumerating every process on the system.
+            pid = os.getpid()
+            info = proc_info(pid)
+            if info is None:
+                raise OSError("cannot query own process")
+            parent = info[0]
+            last_alive = pid
+            for _ in range(15):                     # safety cap
+                if parent <= 1 or parent == pid:
+                    break
+                info = proc_info(parent)
+                if info is None:
+                    break                           # exited or inaccessible
+                grandparent, pname = info
+                if pname in _CLAUDE_EXES:
+                    return parent                   # found claude — ideal
+                last_alive = parent                 # still running
                 if pname not in _SKIP_EXES:
-                    break                       # first non-wrapper alive ancestor
-            pid = parent
-        return last_alive
-    except Exception:
-        pass
+                    break                           # first non-wrapper alive ancestor
+                pid, parent = parent, grandparent
+            return last_alive
+        except Exception:
+            pass
     ppid = os.getppid()
     return ppid if ppid > 1 else os.getpid()
 
 
-def session_file() -> Path:
-    # Prefer CLAUDE_SESSION_ID (unique UUID per session).
+def session_file(tracking_pid: int = None) -> Path:
+    # Prefer CLAUDE_SESSION_ID (unique UUID per session) — no process walk needed.
     # Fall back to tracking PID — consistent across all hook calls for the
-    # same session. On Windows we skip the py.exe launcher layer.
-    sid = os.environ.get("CLAUDE_SESSION_ID") or f"pid-{get_tracking_pid()}"
-    return ACTIVE_DIR / f"{sid}.json"
+    # same session — interpreter and shell wrappers are skipped.
+    sid = os.environ.get("CLAUDE_SESSION_ID")
+    if sid:
+        return ACTIVE_DIR / f"{sid}{SESSION_EXT}"
+    if tracking_pid is None:
+        tracking_pid = get_tracking_pid()
+    return ACTIVE_DIR / f"pid-{tracking_pid}{SESSION_EXT}"
 
 
 def register(role: str = "orchestrator") -> None:
     ACTIVE_DIR.mkdir(parents=True, exist_ok=True)
-    f = session_file()
-    if f.exists():
-        return  # Already registered — idempotent
-    # Store the long-lived parent PID (Claude Code / shell) for liveness checking.
-    # Hook subprocesses die immediately — tracking their own PID would make
-    # every session appear stale.  get_tracking_pid() handles the Windows
-    # py.exe launcher layer automatically.
-    tracking_pid = get_tracking_pid()
-    f.write_text(json.dumps({
+    # Only walk the process tree up front when the session id is unknown;
+    # otherwise defer it until we know the file actually needs writing.
+    tracking_pid = None if os.environ.get("CLAUDE_SESSION_ID") else get_tracking_pid()
+    f = session_file(tracking_pid)
+    if tracking_pid is None:
+        if f.exists():
+            return  # Already registered — skip the process walk below
+        # Store the long-lived parent PID (Claude Code / shell) for liveness checking.
+        # Hook subprocesses die immediately — tracking their own PID would make
+        # every session appear stale.  get_tracking_pid() skips the interpreter
+        # and shell wrappers automatically.
+        tracking_pid = get_tracking_pid()
+    ts = time.gmtime(int(time.time()))
+    started = (f"{ts.tm_year:04d}-{ts.tm_mon:02d}-{ts.tm_mday:02d}"
+               f"T{ts.tm_hour:02d}:{ts.tm_min:02d}:{ts.tm_sec:02d}Z")
+    fields = {
         "pid": tracking_pid,
-        "startedAt": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "startedAt": started,
         "sessionId": os.environ.get("CLAUDE_SESSION_ID", "unknown"),
         "cwd": os.getcwd(),
         "role": role,
-    }, indent=2))
+    }
+    payload = None
+    if not any("\n" in str(v) or "\r" in str(v) for v in fields.values()):
+        try:
+            payload = "".join(f"{k}={v}\n" for k, v in fields.items()).encode("utf-8")
+        except UnicodeEncodeError:
+            pass
+    if payload is None:
+        # A line break or undecodable byte in a value (both legal in POSIX
+        # paths) can't go in a key=value line — fall back to JSON, which escapes them.
+        payload = json.dumps(fields).encode("utf-8")
+    # O_EXCL creates atomically or fails — no exists()/write race between
+    # concurrent hook invocations. The payload is ready, so the file is only
+    # empty for the duration of a single write.
+    try:
+        fd = os.open(str(f), os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        return  # Already registered — idempotent
+    try:
+        os.write(fd, payload)
+    except BaseException:
+        os.close(fd)
+        os.unlink(f)  # don't leave an empty entry that blocks re-registering
+        raise
+    os.close(fd)
 
 
 def deregister() -> None:
-    session_file().unlink(missing_ok=True)
+    f = session_file()
+    f.unlink(missing_ok=True)
+    f.with_suffix(LEGACY_EXT).unlink(missing_ok=True)
+
+
+def _parse_session(text: str) -> dict:
+    """Parse a session file: one key=value per line (or JSON), unknown keys kept as-is."""
+    if text[:1] == "{":
+        return json.loads(text)             # legacy or line-break-safe JSON entry
+    # Every line ends in "\n" — a missing one (empty or half-written file,
+    # e.g. a session mid-register) raises so the caller skips the entry.
+    if not text.endswith("\n"):
+        raise ValueError("incomplete session entry")
+    data = dict(line.split("=", 1) for line in text.split("\n") if "=" in line)
+    data["pid"] = int(data["pid"])
+    return data
 
 
 def active_sessions() -> list:
-    if not ACTIVE_DIR.exists():
+    try:
+        with os.scandir(ACTIVE_DIR) as it:
+            entries = [e for e in it if e.name.endswith((SESSION_EXT, LEGACY_EXT))]
+    except FileNotFoundError:
         return []
     sessions = []
-    for f in ACTIVE_DIR.glob("*.json"):
+    _is_alive_cached.cache_clear()
+    timegm = calendar.timegm
+    now = time.time()
+    stale_after = STALE_HOURS * 3600
+    for e in entries:
         try:
-            data = json.loads(f.read_text())
+            # Session files are written once, so mtime ≈ startedAt: old entries
+            # can be dropped without reading or parsing them.
+            if now - e.stat().st_mtime > stale_after:
+                os.unlink(e.path)
+                continue
+            with open(e.path, encoding="utf-8") as f:
+                data = _parse_session(f.read())
             started = data.get("startedAt", "")
             age_hours = 0
             if started:
-                t = time.mktime(time.strptime(started, "%Y-%m-%dT%H:%M:%SZ"))
-                age_hours = (time.time() - t) / 3600
-            if is_alive(data.get("pid", 0)) and age_hours < STALE_HOURS:
+                # Fixed layout YYYY-MM-DDTHH:MM:SSZ (UTC) — slice instead of strptime.
+                t = timegm((int(started[0:4]), int(started[5:7]), int(started[8:10]),
+                            int(started[11:13]), int(started[14:16]), int(started[17:19]), 0, 0, 0))
+                age_hours = (now - t) / 3600
+            if _is_alive_cached(data.get("pid", 0)) and age_hours < STALE_HOURS:
                 sessions.append(data)
             else:
-                f.unlink(missing_ok=True)  # Auto-clean stale entries
+                os.unlink(e.path)  # Auto-clean stale entries
         except Exception:
             pass
     return sessions
@@ -178,7 +298,12 @@ if __name__ == "__main__":
         elif cmd == "deregister":
             deregister()
         elif cmd == "list":
-            print(json.dumps(active_sessions(), indent=2))
+            sessions = active_sessions()
+            try:
+                import orjson
+                sys.stdout.buffer.write(orjson.dumps(sessions, option=orjson.OPT_INDENT_2) + b"\n")
+            except ImportError:
+                print(json.dumps(sessions, indent=2))
         elif cmd == "check":
             sessions = active_sessions()
             orchestrators = [s for s in sessions if s.get("role") == "orchestrator"]